@@ -220,9 +220,8 @@ class Test(test):
         self._interactive_pause()
         self.run_command('pylint')
         self._interactive_pause()
-        # disabled until there are unit tests to execute
-        # self.run_command('unittest')
-        # self._interactive_pause()
+        self.run_command('unittest')
+        self._interactive_pause()
 
 
 setup(
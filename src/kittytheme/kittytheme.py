@@ -16,9 +16,17 @@
 # limitations under the License.
 
 import argparse
+import math
+import os
+import re
 import sys
 import random
+import time
 
+from datetime import datetime
+from datetime import time as dtime
+from datetime import timedelta
+from datetime import timezone
 from importlib.util import spec_from_file_location
 from importlib.util import module_from_spec
 from pathlib import Path
@@ -32,6 +40,25 @@ DEBUG_OUTPUT_PREFIX = 'debug: '
 
 DEFAULT_CONFIG = '~/.kittythemechanger.py'
 
+# Longest single sleep when waiting for a schedule transition without a
+# wall-clock timer. time.sleep() stops counting while the machine is
+# suspended so the wall clock is re-checked at least this often (seconds).
+SCHEDULE_MAX_SLEEP = 300
+
+# Directory, inside the config's conf_dir, holding precompiled escape
+# sequences for the themes previewed with "--test --tty".
+ESCAPE_CACHE_DIR = 'kitty-theme-cache'
+
+# OSC codes for the theme settings that can be changed with escape sequences.
+# The color0 to color255 settings use OSC 4 with the color index.
+OSC_COLOR_CODES = {
+    'foreground': 10,
+    'background': 11,
+    'cursor': 12,
+    'selection_background': 17,
+    'selection_foreground': 19,
+}
+
 
 def main():
     """Main script logic."""
@@ -43,6 +70,8 @@ def main():
     if args.test and args.live:
         parser.error('The options "--live" and "--test" cannot be '
                      'used together.')
+    if args.tty and not args.test:
+        parser.error('The option "--tty" can only be used with "--test".')
 
     # if --help-config is used, print config help then exit
     if args.config_help:
@@ -93,6 +122,11 @@ def main():
         dprint('calling action: live')
         Actions.live(args, config)
 
+    if args.schedule:
+        do_default = False
+        dprint('calling action: schedule')
+        Actions.schedule(args, config)
+
     if do_default:  # take default action
         dprint('no action provided: calling default action')
         Actions.show(args, config)
@@ -122,6 +156,11 @@ def build_argument_parser():
     parser.add_argument(
         '-T', '--test', dest='test', metavar="TEST_THEME",
         default='', help="Test a new theme in the current kitty session.")
+    parser.add_argument(
+        '--tty', dest='tty', action='store_true', default=False,
+        help=('With "--test", write the theme colors as escape sequences '
+              'directly to the terminal instead of using kitty remote '
+              'control. Used automatically when no config socket is set.'))
     parser.add_argument(
         '-t', '--toggle', dest='toggle', action="store_true",
         default=False, help="Toggle between the dark and light themes.")
@@ -134,6 +173,11 @@ def build_argument_parser():
     parser.add_argument(
         '-L', '--live', dest='live', action='store_true', default=False,
         help='Update existing kitty sessions to use the config.')
+    parser.add_argument(
+        '-S', '--schedule', dest='schedule', action='store_true',
+        default=False,
+        help=('Stay resident and switch between the light and dark themes '
+              'on the configured schedule. See "--help-config".'))
     parser.add_argument(
         '--help-config', action='store_true', dest='config_help',
         default=False,
@@ -161,7 +205,6 @@ def check_config(config):
         ('theme_link', Path),
         ('light_theme_link', Path),
         ('dark_theme_link', Path),
-        ('socket', str)
     ]
     dprint('checking config: {}'.format(dir(config)))
     dprint(config.__file__)
@@ -175,6 +218,69 @@ def check_config(config):
             raise Exception(
                 'The config module is missing a variable named '
                 '{} of type {}'.format(attribute, type))
+    if not isinstance(get_socket(config), str):
+        raise Exception('The config variable socket must be of type {}'
+                        .format(str))
+
+
+def get_socket(config):
+    """Get the kitty socket from the config, or '' when it is not set."""
+    return getattr(config, 'socket', '')
+
+
+def require_socket(config, option):
+    """Ensure a kitty socket is configured for an option using kitty @."""
+    if not get_socket(config):
+        raise Exception(
+            'The config module needs a "socket" variable to use {}. See '
+            '"--help-config".'.format(option))
+
+
+def check_schedule_config(config):
+    """Check that the config module has a usable schedule.
+
+    A schedule is either a pair of fixed "HH:MM" times (light_time and
+    dark_time) or a location (latitude and longitude) used to compute
+    sunrise and sunset.
+    """
+    schedule_type = get_schedule_type(config)
+    if schedule_type == 'fixed':
+        for attribute in ('light_time', 'dark_time'):
+            try:
+                parse_schedule_time(getattr(config, attribute))
+            except (TypeError, ValueError):
+                raise Exception(
+                    'The config variable {} must be a time string of the '
+                    'form "HH:MM"'.format(attribute))
+        if (parse_schedule_time(config.light_time) ==
+                parse_schedule_time(config.dark_time)):
+            raise Exception(
+                'The config variables light_time and dark_time must be '
+                'different times.')
+    elif schedule_type == 'solar':
+        for attribute, limit in (('latitude', 90), ('longitude', 180)):
+            value = getattr(config, attribute)
+            if (not isinstance(value, (int, float)) or
+                    not -limit <= value <= limit):
+                raise Exception(
+                    'The config variable {} must be a number between '
+                    '-{} and {}'.format(attribute, limit, limit))
+    else:
+        raise Exception(
+            'The config module needs either "light_time" and "dark_time" or '
+            '"latitude" and "longitude" variables to use --schedule.')
+
+
+def get_schedule_type(config):
+    """Return "fixed" or "solar" for the configured schedule, else None.
+
+    Fixed times take precedence when both kinds of schedule are configured.
+    """
+    if all(hasattr(config, attr) for attr in ('light_time', 'dark_time')):
+        return 'fixed'
+    if all(hasattr(config, attr) for attr in ('latitude', 'longitude')):
+        return 'solar'
+    return None
 
 
 def get_random_theme_config(theme_dir):
@@ -253,12 +359,91 @@ def test_theme(args, config):
     theme_file = get_theme_file(args.test, config)
     vprint('Changing theme of current kitty window to: {}'.format(
         theme_file.name))
-    cmd = ['kitty', '@', '--to={}'.format(config.socket), 'set-colors',
+    if args.tty or not get_socket(config):
+        write_to_tty(get_escape_sequences(theme_file, config))
+        return
+    cmd = ['kitty', '@', '--to={}'.format(get_socket(config)), 'set-colors',
            theme_file.as_posix()]
     dprint('executing: {}'.format(' '.join(cmd)))
     call(cmd)
 
 
+def compile_escape_sequences(theme_file):
+    """Translate the colors of a theme file into OSC escape sequences.
+
+    Settings that are not colors, or colors that are not "#rrggbb" or "#rgb"
+    values (e.g. "none"), are skipped.
+    """
+    sequences = []
+    with open(theme_file, 'r') as theme:
+        for line in theme:
+            fields = line.split()
+            if len(fields) < 2 or fields[0].startswith('#'):
+                continue
+            name, value = fields[0], fields[1].lstrip('#')
+            if name in OSC_COLOR_CODES:
+                prefix = '{}'.format(OSC_COLOR_CODES[name])
+            elif (name.startswith('color') and name[5:].isdigit() and
+                    int(name[5:]) <= 255):
+                prefix = '4;{}'.format(int(name[5:]))
+            else:
+                continue
+            if len(value) == 3:
+                value = ''.join(digit * 2 for digit in value)
+            if not re.fullmatch('[0-9a-fA-F]{6}', value):
+                continue
+            sequences.append('\x1b]{};rgb:{}/{}/{}\x1b\\'.format(
+                prefix, value[0:2], value[2:4], value[4:6]))
+    return ''.join(sequences).encode('ascii')
+
+
+def get_escape_sequences(theme_file, config):
+    """Get the escape sequences for a theme, compiling them if needed.
+
+    Compiled sequences are cached in the ESCAPE_CACHE_DIR directory of the
+    config's conf_dir and rebuilt whenever the theme file is newer. The
+    cache is best effort: failing to write it does not stop the preview.
+    """
+    cache_file = config.conf_dir.joinpath(
+        ESCAPE_CACHE_DIR, '{}.seq'.format(theme_file.stem))
+    try:
+        if cache_file.stat().st_mtime >= theme_file.stat().st_mtime:
+            dprint('using cached escape sequences: {}'.format(cache_file))
+            return cache_file.read_bytes()
+    except OSError:
+        pass
+    dprint('compiling escape sequences to: {}'.format(cache_file))
+    blob = compile_escape_sequences(theme_file)
+    temp_file = cache_file.with_name(
+        '.{}.{}'.format(cache_file.name, os.getpid()))
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        temp_file.write_bytes(blob)
+        os.replace(temp_file, cache_file)
+    except OSError as exc:
+        dprint('cannot cache escape sequences: {}'.format(exc))
+        try:
+            temp_file.unlink()
+        except OSError:
+            pass
+    return blob
+
+
+def write_to_tty(blob):
+    """Write escape sequences to the controlling terminal in one write."""
+    dprint('writing {} bytes to /dev/tty'.format(len(blob)))
+    try:
+        tty = os.open('/dev/tty', os.O_WRONLY | os.O_NOCTTY)
+    except OSError:
+        print('Error: cannot open /dev/tty. The "--tty" option must be '
+              'used from inside a terminal.')
+        sys.exit(1)
+    try:
+        os.write(tty, blob)
+    finally:
+        os.close(tty)
+
+
 def toggle_themes(args, config):
     """Toggle the themes between light and dark."""
     vprint('Toggling configured theme between light and dark.')
@@ -279,6 +464,15 @@ def toggle_themes(args, config):
         config.theme_link.symlink_to(config.dark_theme_link)
 
 
+def set_theme_mode(config, mode):
+    """Point the main theme link at the "light" or "dark" theme link."""
+    target = (config.light_theme_link if mode == 'light'
+              else config.dark_theme_link)
+    dprint('linking {} to {}'.format(config.theme_link, target))
+    config.theme_link.unlink()
+    config.theme_link.symlink_to(target)
+
+
 def set_dark_theme(args, config):
     """Set the default theme to the configured dark theme."""
     theme_file = get_theme_file(args.set_dark, config)
@@ -301,12 +495,146 @@ def set_light_theme(args, config):
 
 def make_theme_live(args, config):
     """Update all existing kitty sessions to use the configured theme."""
+    require_socket(config, '--live')
     vprint('Changing theme of all running kitty windows to: {}'.format(
         config.theme_link.resolve().name))
-    cmd = ['kitty', '@', '--to={}'.format(config.socket), 'set-colors',
+    cmd = ['kitty', '@', '--to={}'.format(get_socket(config)), 'set-colors',
            '--all', config.theme_link.as_posix()]
     dprint('executing: {}'.format(' '.join(cmd)))
-    call(cmd)
+    return call(cmd)
+
+
+def parse_schedule_time(text):
+    """Convert a "HH:MM" string into a datetime.time object."""
+    return datetime.strptime(text, '%H:%M').time()
+
+
+def sun_times(day, latitude, longitude):
+    """Calculate the sunrise and sunset for a date at the given location.
+
+    Uses the sunrise equation (accurate to a minute or two outside the polar
+    regions). Returns a tuple of UTC datetimes (sunrise, sunset). When the
+    sun does not cross the horizon on that day the tuple is ('light', None)
+    for midnight sun and ('dark', None) for polar night.
+    """
+    # days since the J2000 epoch (2000-01-01 12:00 UTC, Julian day 2451545)
+    days = day.toordinal() - datetime(2000, 1, 1).toordinal()
+    mean_noon = days - longitude / 360
+    anomaly = math.radians((357.5291 + 0.98560028 * mean_noon) % 360)
+    center = (1.9148 * math.sin(anomaly) + 0.0200 * math.sin(2 * anomaly) +
+              0.0003 * math.sin(3 * anomaly))
+    ecliptic = math.radians(
+        (math.degrees(anomaly) + center + 180 + 102.9372) % 360)
+    transit = (mean_noon + 0.0053 * math.sin(anomaly) -
+               0.0069 * math.sin(2 * ecliptic))
+    declination = math.asin(math.sin(ecliptic) *
+                            math.sin(math.radians(23.4397)))
+    phi = math.radians(latitude)
+    cos_hour_angle = (
+        (math.sin(math.radians(-0.833)) -
+         math.sin(phi) * math.sin(declination)) /
+        (math.cos(phi) * math.cos(declination)))
+    if cos_hour_angle < -1:
+        return ('light', None)
+    if cos_hour_angle > 1:
+        return ('dark', None)
+    hour_angle = math.degrees(math.acos(cos_hour_angle)) / 360
+    epoch = datetime(2000, 1, 1, 12, tzinfo=timezone.utc)
+    return (epoch + timedelta(days=transit - hour_angle),
+            epoch + timedelta(days=transit + hour_angle))
+
+
+def get_transitions(day, config):
+    """List the (datetime, mode) theme transitions for the given date."""
+    if get_schedule_type(config) == 'fixed':
+        return sorted(
+            (datetime.combine(day, parse_schedule_time(text)).astimezone(),
+             mode)
+            for text, mode in ((config.light_time, 'light'),
+                               (config.dark_time, 'dark')))
+    sunrise, sunset = sun_times(day, config.latitude, config.longitude)
+    if sunset is None:
+        # no sunrise or sunset: hold the polar mode from local midnight
+        return [(datetime.combine(day, dtime()).astimezone(), sunrise)]
+    return [(sunrise.astimezone(), 'light'), (sunset.astimezone(), 'dark')]
+
+
+def get_schedule_state(config, now):
+    """Find the mode that should be active now and the next transition."""
+    transitions = []
+    for offset in range(-2, 3):
+        transitions.extend(
+            get_transitions(now.date() + timedelta(days=offset), config))
+    transitions.sort()
+    past = [mode for when, mode in transitions if when <= now]
+    future = [when for when, mode in transitions if when > now]
+    mode = past[-1] if past else 'dark'
+    next_transition = future[0] if future else now + timedelta(days=1)
+    return mode, next_transition
+
+
+def wait_until(when):
+    """Block until the wall clock reaches the given aware datetime.
+
+    Where the platform provides timerfd a single CLOCK_REALTIME timer is
+    armed, which fires immediately on resume if the deadline passed while
+    suspended. Otherwise sleep in chunks of at most SCHEDULE_MAX_SLEEP.
+    """
+    if hasattr(os, 'timerfd_create'):
+        timer = os.timerfd_create(time.CLOCK_REALTIME)
+        try:
+            os.timerfd_settime(timer, flags=os.TFD_TIMER_ABSTIME,
+                               initial=when.timestamp())
+            os.read(timer, 8)
+        finally:
+            os.close(timer)
+        return
+    while True:
+        remaining = when.timestamp() - time.time()
+        if remaining <= 0:
+            return
+        time.sleep(min(remaining, SCHEDULE_MAX_SLEEP))
+
+
+def run_schedule(args, config):
+    """Switch between the light and dark themes on the configured schedule.
+
+    Sleeps until the next transition then links and makes live the theme
+    for the current time once. After a suspend any missed transitions
+    collapse into a single switch to the theme that is due now. A failed
+    switch is retried after SCHEDULE_MAX_SLEEP seconds.
+    """
+    check_schedule_config(config)
+    require_socket(config, '--schedule')
+    vprint('Running theme schedule. Press Ctrl-C to stop.')
+    active = None
+    try:
+        while True:
+            now = datetime.now().astimezone()
+            mode, next_transition = get_schedule_state(config, now)
+            if mode != active:
+                vprint('{}: switching to the {} theme.'.format(
+                    now.strftime('%Y-%m-%d %H:%M'), mode))
+                set_theme_mode(config, mode)
+                try:
+                    returncode = make_theme_live(args, config)
+                    status = ('kitty exited with status {}'.format(returncode)
+                              if returncode else '')
+                except OSError as exc:
+                    status = exc
+                if status:
+                    print('Error: failed to make the {} theme live ({}). '
+                          'Retrying in {} seconds.'.format(
+                              mode, status, SCHEDULE_MAX_SLEEP))
+                    next_transition = min(
+                        next_transition,
+                        now + timedelta(seconds=SCHEDULE_MAX_SLEEP))
+                else:
+                    active = mode
+            dprint('next theme transition at {}'.format(next_transition))
+            wait_until(next_transition)
+    except KeyboardInterrupt:
+        print('...interrupted by user, exiting.')
 
 
 def print_config_help():
@@ -328,7 +656,9 @@ def print_config_help():
     msg += "   - theme_link (pathlib.Path): Symlink file Kitty loads from kitty.conf\n"
     msg += "   - light_theme_link (pathlib.Path): Symlink to a 'light' theme config file.\n"
     msg += "   - dark_theme_link (pathlib.Path): Symlink to a 'dark' theme config file.\n"
-    msg += "   - socket (str): a Kitty compatible socket string for the '--listen-on' flag. See 'man kitty'.\n\n"
+    msg += "   - socket (str): a Kitty compatible socket string for the '--listen-on' flag. See 'man kitty'.\n"
+    msg += "     Required by '--live' and '--schedule'. When unset or '', '--test' writes\n"
+    msg += "     escape sequences to the terminal instead.\n\n"
     msg += "   An example .kittythemechanger.py file is shown below::\n\n"
     msg += "       '''A config module for the Kitty Theme Changer Tool.'''\n"
     msg += "       from pathlib import Path\n"
@@ -337,7 +667,14 @@ def print_config_help():
     msg += "       theme_link = conf_dir.joinpath('theme.conf')\n"
     msg += "       light_theme_link = conf_dir.joinpath('light-theme.conf')\n"
     msg += "       dark_theme_link = conf_dir.joinpath('dark-theme.conf')\n"
-    msg += "       socket = 'unix:/tmp/kittysocket'\n"
+    msg += "       socket = 'unix:/tmp/kittysocket'\n\n"
+    msg += "4. Optionally, to use the '--schedule' option, add either fixed\n"
+    msg += "   times or a location for sunrise and sunset to the config file:\n\n"
+    msg += "   - light_time (str) and dark_time (str): local times as 'HH:MM'.\n"
+    msg += "   - latitude (float) and longitude (float): degrees, north and east positive.\n\n"
+    msg += "   For example::\n\n"
+    msg += "       light_time = '07:30'\n"
+    msg += "       dark_time = '19:00'\n"
     print(msg)
 
 
@@ -351,6 +688,7 @@ class Actions:
     set_dark = set_dark_theme
     set_light = set_light_theme
     live = make_theme_live
+    schedule = run_schedule
 
 
 def dprint(msg):
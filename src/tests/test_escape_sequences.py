@@ -0,0 +1,63 @@
+"""Tests for compiling theme files into terminal escape sequences."""
+
+import os
+import tempfile
+import unittest
+
+from pathlib import Path
+from types import SimpleNamespace
+
+from kittytheme import kittytheme
+
+
+THEME = """# A test theme
+foreground #DDEEFF
+background #000
+cursor none
+color1 #ff0000
+color256 #ffffff
+selection_background #0x1234
+selection_foreground #123456
+url_color #aabbcc
+font_size 12
+"""
+
+
+class TestEscapeSequences(unittest.TestCase):
+    """Tests for compile_escape_sequences and get_escape_sequences."""
+
+    def setUp(self):
+        """Write the test theme into a temporary directory."""
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+        self.theme_file = Path(self.tempdir.name, 'Test.conf')
+        self.theme_file.write_text(THEME)
+
+    def test_compile(self):
+        """Only valid colors are compiled into OSC sequences."""
+        self.assertEqual(
+            kittytheme.compile_escape_sequences(self.theme_file),
+            b'\x1b]10;rgb:DD/EE/FF\x1b\\'
+            b'\x1b]11;rgb:00/00/00\x1b\\'
+            b'\x1b]4;1;rgb:ff/00/00\x1b\\'
+            b'\x1b]19;rgb:12/34/56\x1b\\')
+
+    def test_cache(self):
+        """The compiled sequences are cached in the conf_dir."""
+        config = SimpleNamespace(conf_dir=Path(self.tempdir.name))
+        blob = kittytheme.get_escape_sequences(self.theme_file, config)
+        cache_file = config.conf_dir.joinpath(
+            kittytheme.ESCAPE_CACHE_DIR, 'Test.seq')
+        self.assertEqual(cache_file.read_bytes(), blob)
+        self.assertEqual(os.listdir(cache_file.parent), ['Test.seq'])
+
+    def test_unwritable_cache(self):
+        """Failing to write the cache still returns the sequences."""
+        config = SimpleNamespace(conf_dir=self.theme_file)
+        self.assertEqual(
+            kittytheme.get_escape_sequences(self.theme_file, config),
+            kittytheme.compile_escape_sequences(self.theme_file))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+"""Tests for the light and dark theme schedule."""
+
+import unittest
+
+from datetime import date
+from datetime import datetime
+from datetime import timezone
+from types import SimpleNamespace
+
+from kittytheme import kittytheme
+
+
+class TestSunTimes(unittest.TestCase):
+    """Tests for the sun_times function."""
+
+    def test_london_midsummer(self):
+        """Sunrise and sunset in London on the summer solstice."""
+        sunrise, sunset = kittytheme.sun_times(
+            date(2026, 6, 21), 51.5, -0.13)
+        self.assertEqual(sunrise.tzinfo, timezone.utc)
+        self.assertEqual((sunrise.hour, sunrise.minute), (3, 43))
+        self.assertEqual((sunset.hour, sunset.minute), (20, 21))
+
+    def test_polar_day_and_night(self):
+        """No sunrise or sunset returns the mode to hold for the day."""
+        self.assertEqual(kittytheme.sun_times(date(2026, 6, 21), 78, 15),
+                         ('light', None))
+        self.assertEqual(kittytheme.sun_times(date(2026, 12, 21), 78, 15),
+                         ('dark', None))
+
+
+class TestScheduleState(unittest.TestCase):
+    """Tests for the get_schedule_state function with fixed times."""
+
+    config = SimpleNamespace(light_time='07:30', dark_time='19:00')
+
+    @staticmethod
+    def local(*args):
+        """Make an aware local datetime."""
+        return datetime(*args).astimezone()
+
+    def test_daytime(self):
+        """During the day the light theme is active until dark_time."""
+        mode, next_transition = kittytheme.get_schedule_state(
+            self.config, self.local(2026, 6, 21, 12, 0))
+        self.assertEqual(mode, 'light')
+        self.assertEqual(next_transition, self.local(2026, 6, 21, 19, 0))
+
+    def test_after_midnight(self):
+        """After midnight the dark theme is active until light_time."""
+        mode, next_transition = kittytheme.get_schedule_state(
+            self.config, self.local(2026, 6, 21, 1, 0))
+        self.assertEqual(mode, 'dark')
+        self.assertEqual(next_transition, self.local(2026, 6, 21, 7, 30))
+
+    def test_partial_fixed_schedule(self):
+        """A partial fixed schedule falls back to the solar schedule."""
+        config = SimpleNamespace(light_time='07:30', latitude=51.5,
+                                 longitude=-0.13)
+        self.assertEqual(kittytheme.get_schedule_type(config), 'solar')
+        kittytheme.check_schedule_config(config)
+        kittytheme.get_schedule_state(config, self.local(2026, 6, 21, 12, 0))
+
+    def test_equal_times_rejected(self):
+        """The light and dark times must differ."""
+        config = SimpleNamespace(light_time='07:30', dark_time='07:30')
+        with self.assertRaises(Exception):
+            kittytheme.check_schedule_config(config)
+
+
+if __name__ == '__main__':
+    unittest.main()